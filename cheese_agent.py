@@ -7,14 +7,55 @@ to upload using MCP tools.
 
 import os
 import json
-import hashlib
 import logging
+import logging.handlers
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional
 
 from cheese_scraper import CheeseScraper
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps_state(state: Dict) -> bytes:
+    """Serialize agent state to indented JSON bytes, using orjson when available."""
+    if orjson:
+        return orjson.dumps(state, option=orjson.OPT_INDENT_2)
+    return json.dumps(state, indent=2).encode()
+
+def _loads_state(data: bytes) -> Dict:
+    """Parse agent state from JSON bytes, using orjson when available."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _escape_context_value(value) -> str:
+    """Escape the characters Cloudinary uses as context separators."""
+    return str(value).replace('=', '\\=').replace('|', '\\|')
+
+class BatchedFileMemoryHandler(logging.handlers.MemoryHandler):
+    """
+    MemoryHandler whose flush formats the whole buffer and hands it to the
+    target FileHandler's stream in a single write, followed by one flush.
+    """
+
+    def flush(self):
+        with self.lock:
+            if not self.target or not self.buffer:
+                return
+            target = self.target
+            try:
+                batch = ''.join(target.format(r) + target.terminator for r in self.buffer)
+                with target.lock:
+                    target.stream.write(batch)
+                    target.stream.flush()
+            except Exception:
+                target.handleError(self.buffer[-1])
+            self.buffer.clear()
+
 class CheeseScrapingAgent:
     def __init__(self):
         """Initialize the autonomous cheese scraping agent."""
@@ -29,20 +70,32 @@ class CheeseScrapingAgent:
         today = datetime.now().strftime('%Y-%m-%d')
         log_file = self.daily_log_dir / f"cheese_agent_{today}.log"
         
+        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+
+        # Buffer file records and write them out in batches; errors flush immediately
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(logging.Formatter(log_format))
+        memory_handler = BatchedFileMemoryHandler(
+            capacity=64, flushLevel=logging.ERROR, target=file_handler
+        )
+        # force=True replaces the handlers cheese_scraper installs on import
         logging.basicConfig(
             level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
+            format=log_format,
+            handlers=[memory_handler, logging.StreamHandler()],
+            force=True
         )
         self.logger = logging.getLogger(__name__)
         
         self.daily_target = 10
+        self.daily_stats_days = 90
         self.state = self.load_agent_state()
         
         self.logger.info("🤖 Cheese Scraping Agent initialized")
         
         try:
             self.scraper = CheeseScraper()
+            self.scraper.seen_hashes = set(self.state['seen_hashes'])
             self.logger.info("✅ Scraper initialized successfully.")
         except Exception as e:
             self.logger.error(f"❌ Failed to initialize: {e}", exc_info=True)
@@ -54,28 +107,47 @@ class CheeseScrapingAgent:
             'total_images_scraped': 0,
             'pending_uploads': [],
             'daily_stats': {},
+            'seen_hashes': [],
         }
         
         if self.state_file.exists():
             try:
-                with open(self.state_file, 'r') as f:
-                    state = json.load(f)
+                state = _loads_state(self.state_file.read_bytes())
                 for key, value in default_state.items():
                     if key not in state:
                         state[key] = value
+                self._pending_index = {p['file_path'] for p in state['pending_uploads']}
                 return state
             except Exception as e:
                 self.logger.warning(f"Failed to load agent state: {e}")
         
+        self._pending_index = set()
         return default_state
     
     def save_agent_state(self):
-        """Save the agent's current state."""
+        """Save the agent's current state atomically."""
+        # Only keep the most recent days of stats so the state file stays small
+        daily_stats = self.state['daily_stats']
+        if len(daily_stats) > self.daily_stats_days:
+            keep = sorted(daily_stats)[-self.daily_stats_days:]
+            self.state['daily_stats'] = {day: daily_stats[day] for day in keep}
+
+        tmp_file = self.state_file.with_suffix('.tmp')
         try:
-            with open(self.state_file, 'w') as f:
-                json.dump(self.state, f, indent=2)
+            data = _dumps_state(self.state)
+            with open(tmp_file, 'wb', buffering=0) as f:
+                # A raw write may be short (e.g. on a nearly full disk), so loop until done
+                view = memoryview(data)
+                while view:
+                    written = f.write(view)
+                    if not written:
+                        raise OSError(f"Short write to {tmp_file}")
+                    view = view[written:]
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.state_file)
         except Exception as e:
             self.logger.error(f"Failed to save agent state: {e}")
+            tmp_file.unlink(missing_ok=True)
 
     def run(self):
         """
@@ -101,9 +173,11 @@ class CheeseScrapingAgent:
             pending_list = []
             for cand in candidates:
                 file_path = Path(cand['file_path'])
-                file_hash = hashlib.md5(file_path.read_bytes()).hexdigest()[:8]
+                file_hash = cand['file_hash'][:8]
                 public_id = f"cheese-collection/{file_path.stem}_{file_hash}"
-                context_str = '|'.join([f'{k}={v}' for k, v in cand['metadata']['context'].items()])
+                context_str = '|'.join([
+                    f'{k}={_escape_context_value(v)}' for k, v in cand['metadata']['context'].items()
+                ])
 
                 pending_list.append({
                     "file_path": f"file://{file_path.resolve()}",
@@ -113,15 +187,18 @@ class CheeseScrapingAgent:
                 })
 
             # Add new candidates to state, avoiding duplicates
-            existing_paths = {p['file_path'] for p in self.state['pending_uploads']}
             new_candidates_added = 0
-            for pending_item in pending_list:
-                if pending_item['file_path'] not in existing_paths:
+            queued_hashes = set(self.state['seen_hashes'])
+            for cand, pending_item in zip(candidates, pending_list):
+                if pending_item['file_path'] not in self._pending_index:
                     self.state['pending_uploads'].append(pending_item)
-                    existing_paths.add(pending_item['file_path'])
+                    self._pending_index.add(pending_item['file_path'])
                     new_candidates_added +=1
+                queued_hashes.add(cand['file_hash'])
             
             self.state['total_images_scraped'] += new_candidates_added
+            # Only images that actually made it into the queue count as seen
+            self.state['seen_hashes'] = sorted(queued_hashes)
             
             # Update or initialize daily stats
             if today_str not in self.state['daily_stats']:
@@ -139,6 +216,9 @@ class CheeseScrapingAgent:
         except Exception as e:
             self.logger.error(f"❌ Agent run failed: {e}", exc_info=True)
         finally:
+            self.scraper.close()
+            # Drop hashes of anything this run saved but never queued
+            self.scraper.seen_hashes = set(self.state['seen_hashes'])
             self.save_agent_state()
 
 if __name__ == '__main__':
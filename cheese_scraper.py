@@ -2,27 +2,27 @@
 """
 Cheese Image Scraper
 
-This version scrapes cheese images and saves them locally.
+This version searches the Openverse API for cheese images and saves them locally.
 The uploading is handled by a separate Node.js script.
 """
 
 import os
+import io
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import hashlib
+import shutil
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import zip_longest
 from pathlib import Path
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import json
 from datetime import datetime
-import base64
-
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+
 from PIL import Image
 
 # Configure logging
@@ -36,196 +36,349 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _fast_dims(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG or PNG header without decoding the image."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+
+    if data[:2] == b'\xff\xd8':
+        i = 2
+        while i + 9 <= len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:  # Fill byte
+                i += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+                i += 2
+                continue
+            # SOFn frame headers hold the dimensions; C4/C8/CC are DHT/JPG/DAC
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack_from('>HH', data, i + 5)
+                return width, height
+            i += 2 + struct.unpack_from('>H', data, i + 2)[0]
+
+    return None
+
 class CheeseScraper:
     def __init__(self):
         """Initialize the cheese image scraper."""
-        
+
         self.output_dir = Path("scraped_cheese_images")
         self.output_dir.mkdir(exist_ok=True)
-        
-        self.chrome_options = Options()
-        self.chrome_options.add_argument("--headless")
-        self.chrome_options.add_argument("--no-sandbox")
-        self.chrome_options.add_argument("--disable-dev-shm-usage")
-        self.chrome_options.add_argument("--disable-gpu")
-        self.chrome_options.add_argument("--window-size=1920,1080")
-        
+
+        self.search_api_url = "https://api.openverse.org/v1/images/"
+
         self.cheese_types = [
             'semi soft', 'bloomy', 'blue', 'hard', 'washed rind', 'fresh'
         ]
-        
+
         self.min_width = 100
         self.min_height = 100
         self.max_file_size = 10 * 1024 * 1024  # 10MB
-        
-    def get_search_url(self, cheese_type: str) -> str:
-        """Generate Google Image Search URL for a specific cheese type."""
-        base_url = "https://www.google.com/search?"
-        params = {
-            'q': f'{cheese_type} cheese',
-            'tbm': 'isch',
-            'as_st': 'y',
-            'imgtype': 'photo',
-            'tbs': 'sur:cl',
-        }
-        return base_url + requests.compat.urlencode(params)
+        self.download_workers = 8
+        # Fetch more results than needed so images seen in earlier runs can be replaced
+        self.search_page_size = 20  # Openverse's maximum for anonymous requests
+        self.scrape_date = datetime.now().strftime('%Y-%m-%d')
+        self.request_timeout = (3, 10)  # (connect, read) seconds
 
-    def scrape_image_data(self, search_url: str, max_images: int) -> List[str]:
-        """Scrape Base64 image data from a Google Images search results page."""
-        logger.info(f"Scraping image data from: {search_url}")
-        image_data_list = []
-        driver = None
-        try:
-            service = Service()
-            driver = webdriver.Chrome(service=service, options=self.chrome_options)
-            driver.get(search_url)
+        # One pooled session for every search and download so TLS connections are reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=len(self.cheese_types) + self.download_workers,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-            # Wait for the inner img elements to be present inside the g-img wrappers
-            WebDriverWait(driver, 20).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, "g-img img"))
-            )
+        # MD5 hex digests of every image already accepted, across sessions
+        self.seen_hashes = set()
+        self._seen_lock = threading.Lock()
 
-            # Scroll down multiple times to ensure all images are loaded
-            for _ in range(3): # Scroll 3 times
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
-
-            # Find all g-img wrapper elements
-            g_img_elements = driver.find_elements(By.CSS_SELECTOR, "g-img")
-                     
-            for g_img in g_img_elements:
-                try:
-                    # Find the actual <img> tag inside the <g-img> wrapper
-                    img = g_img.find_element(By.TAG_NAME, 'img')
-                    src = img.get_attribute('src')
-                    if src and src.startswith('data:image'):
-                        if src not in image_data_list:
-                            image_data_list.append(src)
-                except Exception:
-                    continue
+        self._executor = None
+        self._download_executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-            if not image_data_list:
-                logger.warning(f"⚠️  Could not find any valid Base64 image data within <g-img> elements.")
+    def close(self):
+        """Shut down the worker pools and the shared HTTP session."""
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._download_executor:
+            self._download_executor.shutdown(wait=True, cancel_futures=True)
+            self._download_executor = None
+        self.session.close()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the session's worker pool, creating it on first use."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.cheese_types))
+        return self._executor
+
+    def _get_download_executor(self) -> ThreadPoolExecutor:
+        """Return the session's per-image download pool, creating it on first use."""
+        if self._download_executor is None:
+            self._download_executor = ThreadPoolExecutor(max_workers=self.download_workers)
+        return self._download_executor
+
+    def _search_openverse(self, cheese_type: str, n: int) -> List[Dict]:
+        """
+        Search Openverse for commercially usable photos of a cheese type.
+
+        Returns one dict per image with its URL and the license and attribution
+        details needed to credit CC BY images.
+        """
+        logger.info(f"Searching Openverse for '{cheese_type} cheese'")
+        try:
+            resp = self.session.get(
+                self.search_api_url,
+                params={
+                    'q': f'{cheese_type} cheese',
+                    'license': 'cc0,by',
+                    'category': 'photograph',
+                    'extension': 'jpg',
+                    'page_size': n,
+                },
+                timeout=self.request_timeout,
+            )
+            resp.raise_for_status()
+            seen = set()
+            images = []
+            for result in resp.json().get('results', []):
+                url = result.get('url')
+                if url and url not in seen:
+                    seen.add(url)
+                    images.append({
+                        'url': url,
+                        'license': result.get('license'),
+                        'license_version': result.get('license_version'),
+                        'creator': result.get('creator'),
+                        'foreign_landing_url': result.get('foreign_landing_url'),
+                    })
+
+            if not images:
+                logger.warning(f"⚠️  Openverse returned no images for '{cheese_type}'.")
                 return []
 
-            logger.info(f"Successfully extracted {len(image_data_list)} Base64 image sources.")
-            return image_data_list[:max_images]
-        
+            logger.info(f"Successfully found {len(images)} image URLs.")
+            return images[:n]
+
         except Exception as e:
-            logger.error(f"Error scraping {search_url}: {e}", exc_info=True)
+            logger.error(f"Error searching Openverse for '{cheese_type}': {e}", exc_info=True)
             return []
-        finally:
-            if driver:
-                driver.quit()
 
-    def save_base64_image(self, base64_data: str, filename: str) -> Optional[Path]:
-        """Decode a Base64 string and save it as an image file."""
+    def download_image(self, url: str) -> Optional[bytes]:
+        """Download the raw bytes of an image, giving up once it exceeds max_file_size."""
         try:
-            header, encoded = base64_data.split(",", 1)
-            image_data = base64.b64decode(encoded)
+            with self.session.get(url, timeout=self.request_timeout, stream=True) as resp:
+                resp.raise_for_status()
 
+                content_length = resp.headers.get('Content-Length')
+                if content_length and content_length.isdigit() and int(content_length) > self.max_file_size:
+                    logger.warning(f"Skipping large file: {url} ({content_length} bytes)")
+                    return None
+
+                buf = bytearray()
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    buf += chunk
+                    if len(buf) > self.max_file_size:
+                        logger.warning(f"Skipping large file: {url} (over {self.max_file_size} bytes)")
+                        return None
+                return bytes(buf)
+        except Exception as e:
+            logger.error(f"Failed to download image {url}: {e}")
+        return None
+
+    def save_image_bytes(self, image_data: bytes, filename: str) -> Optional[Path]:
+        """Validate downloaded image bytes and save them as an image file."""
+        try:
             if len(image_data) > self.max_file_size:
-                logger.warning(f"Skipping large file generated from Base64 data.")
+                logger.warning(f"Skipping large file: {filename}")
+                return None
+
+            # Validate in memory so rejected images never touch the disk
+            dims = _fast_dims(image_data)
+            if dims:
+                width, height = dims
+            else:
+                with Image.open(io.BytesIO(image_data)) as img:
+                    img.verify()
+                    width, height = img.size
+            if width < self.min_width or height < self.min_height:
+                logger.warning(f"Skipping small image: {filename} ({width}x{height})")
                 return None
 
             file_path = self.output_dir / filename
             with open(file_path, 'wb') as f:
                 f.write(image_data)
 
-            # Re-enable size validation
-            with Image.open(file_path) as img:
-                if img.width < self.min_width or img.height < self.min_height:
-                    logger.warning(f"Skipping small image: {filename} ({img.width}x{img.height})")
-                    file_path.unlink()
-                    return None
-            
             return file_path
-            
+
         except Exception as e:
-            logger.error(f"Failed to save Base64 image {filename}: {e}")
+            logger.error(f"Failed to save image {filename}: {e}")
         return None
 
-    def analyze_image_content(self, file_path: Path, cheese_type: str) -> Dict:
-        """Generate tags and context for the image."""
+    def analyze_image_content(self, file_path: Path, cheese_type: str, image: Dict) -> Dict:
+        """Generate tags and context, including license attribution, for the image."""
+        license_code = image.get('license') or 'unknown'
+        if license_code != 'cc0':
+            license_code = f"cc-{license_code}"
+        if image.get('license_version'):
+            license_code = f"{license_code}-{image['license_version']}"
+
+        context = {
+            'source': 'openverse',
+            'license': license_code,
+            'creator': image.get('creator'),
+            'source_url': image.get('foreign_landing_url'),
+            'scrape_date': self.scrape_date
+        }
         return {
             'tags': ['cheese', cheese_type],
-            'context': {
-                'source': 'google-images',
-                'license': 'creative-commons',
-                'scrape_date': datetime.now().strftime('%Y-%m-%d')
-            }
+            'context': {k: v for k, v in context.items() if v}
         }
 
     def cleanup_local_images(self):
         """Remove all downloaded image files after processing."""
         try:
-            image_files = list(self.output_dir.glob("*.jpg"))
-            if image_files:
-                logger.info(f"🧹 Cleaning up {len(image_files)} downloaded images...")
-                for img_file in image_files:
-                    img_file.unlink()
+            file_count = sum(1 for _ in self.output_dir.iterdir())
+            if file_count:
+                logger.info(f"🧹 Cleaning up {file_count} downloaded files...")
+                # The output directory is scratch space, so drop and recreate it wholesale
+                shutil.rmtree(self.output_dir)
+                self.output_dir.mkdir(exist_ok=True)
                 logger.info("✅ Image cleanup completed.")
         except Exception as e:
             logger.warning(f"⚠️  Error during cleanup: {e}")
 
+    def _scrape_one(self, cheese_type: str, images_per_type: int) -> Tuple[str, List[Dict]]:
+        """Search for images of a single cheese type."""
+        logger.info(f"--- Starting search for '{cheese_type}' cheese ---")
+        return cheese_type, self._search_openverse(cheese_type, images_per_type)
+
+    def _process_image(self, image: Dict, cheese_type: str, safe_type: str) -> Optional[Dict]:
+        """Download, validate and save a single image, returning its candidate entry."""
+        url = image['url']
+        image_data = self.download_image(url)
+        if not image_data:
+            return None
+
+        file_hash = hashlib.md5(image_data).hexdigest()
+        with self._seen_lock:
+            if file_hash in self.seen_hashes:
+                logger.info(f"Skipping already seen image: {url}")
+                return None
+            self.seen_hashes.add(file_hash)
+
+        filename = f"{safe_type}_{file_hash[:10]}.jpg"
+
+        file_path = self.save_image_bytes(image_data, filename)
+        if file_path:
+            try:
+                metadata = self.analyze_image_content(file_path, cheese_type, image)
+                return {
+                    'id': filename,
+                    'file_path': str(file_path),
+                    'cheese_type': cheese_type,
+                    'file_hash': file_hash,
+                    'metadata': metadata
+                }
+            except Exception as e:
+                logger.error(f"Error processing and analyzing {filename}: {e}")
+                file_path.unlink(missing_ok=True)
+
+        # Not accepted, so release the reservation for a later run to retry
+        with self._seen_lock:
+            self.seen_hashes.discard(file_hash)
+        return None
+
     def find_and_download_candidates(self, max_total_images: int = 12) -> List[Dict]:
         """
         Finds and downloads cheese images, returning a list of candidates for upload.
+
+        Each cheese type is searched concurrently on the session's worker pool.
+        Search results are over-fetched and their downloads interleaved across
+        cheese types on the download pool; once a type has images_per_type new
+        candidates, its remaining downloads are cancelled.
         """
         candidates_found = []
-        processed_count = 0
-        
+
         logger.info(f"🚀 Starting cheese image candidate search. Target: {max_total_images} images.")
 
-        for cheese_type in self.cheese_types:
-            if len(candidates_found) >= max_total_images:
-                break
-                
-            logger.info(f"--- Starting search for '{cheese_type}' cheese ---")
-            search_url = self.get_search_url(cheese_type)
-            
-            # For each category, we aim to get a few images
-            images_per_type = max_total_images // len(self.cheese_types) + 1
-            image_data_list = self.scrape_image_data(search_url, images_per_type)
-        
-            for b64_data in image_data_list:
-                if len(candidates_found) >= max_total_images:
-                    break
-                
-                processed_count += 1
-                file_hash = hashlib.md5(b64_data.encode()).hexdigest()[:10]
-                filename = f"{cheese_type.replace(' ', '_')}_{file_hash}.jpg"
-                
-                file_path = self.save_base64_image(b64_data, filename)
-                if not file_path:
+        # For each category, we aim to get a few images
+        images_per_type = max_total_images // len(self.cheese_types) + 1
+
+        executor = self._get_executor()
+        download_executor = self._get_download_executor()
+        search_futures = [
+            executor.submit(self._scrape_one, cheese_type, self.search_page_size)
+            for cheese_type in self.cheese_types
+        ]
+        search_results = [future.result() for future in as_completed(search_futures)]
+
+        # Submit round-robin so every type's first results are downloaded first
+        futures_by_type = {cheese_type: [] for cheese_type, _ in search_results}
+        image_futures = []
+        jobs_by_type = [
+            [(image, cheese_type, cheese_type.replace(' ', '_')) for image in images]
+            for cheese_type, images in search_results
+        ]
+        for row in zip_longest(*jobs_by_type):
+            for job in row:
+                if job is None:
                     continue
-                
-                try:
-                    metadata = self.analyze_image_content(file_path, cheese_type)
-                    
-                    candidate = {
-                        'id': filename,
-                        'file_path': str(file_path),
-                        'cheese_type': cheese_type,
-                        'metadata': metadata
-                    }
-                    candidates_found.append(candidate)
-                    logger.info(f"✅ Found candidate: {filename} for type {cheese_type}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing and analyzing {filename}: {e}")
-            
+                future = download_executor.submit(self._process_image, *job)
+                futures_by_type[job[1]].append(future)
+                image_futures.append(future)
+
+        counts_by_type = {cheese_type: 0 for cheese_type in futures_by_type}
+        for future in as_completed(image_futures):
+            if future.cancelled():
+                continue
+            candidate = future.result()
+            if not candidate:
+                continue
+
+            cheese_type = candidate['cheese_type']
+            if (len(candidates_found) >= max_total_images
+                    or counts_by_type[cheese_type] >= images_per_type):
+                # Finished after its target was reached; don't leave it behind
+                Path(candidate['file_path']).unlink(missing_ok=True)
+                with self._seen_lock:
+                    self.seen_hashes.discard(candidate['file_hash'])
+                continue
+
+            candidates_found.append(candidate)
+            counts_by_type[cheese_type] += 1
+            logger.info(f"✅ Found candidate: {candidate['id']} for type {cheese_type}")
+
+            if counts_by_type[cheese_type] >= images_per_type:
+                for pending in futures_by_type[cheese_type]:
+                    pending.cancel()
+
             if len(candidates_found) >= max_total_images:
                 logger.info("🎯 Reached maximum total image target.")
-                break
+                for pending in image_futures:
+                    pending.cancel()
 
         logger.info(f"Scraping session completed! Found {len(candidates_found)} total candidates.")
         return candidates_found
 
 if __name__ == '__main__':
-    scraper = CheeseScraper()
-    candidates = scraper.find_and_download_candidates(5)
-    print("\n--- Found Candidates ---")
-    for cand in candidates:
-        print(json.dumps(cand, indent=2))
-    scraper.cleanup_local_images() 
\ No newline at end of file
+    with CheeseScraper() as scraper:
+        candidates = scraper.find_and_download_candidates(5)
+        print("\n--- Found Candidates ---")
+        for cand in candidates:
+            print(json.dumps(cand, indent=2))
+        scraper.cleanup_local_images()